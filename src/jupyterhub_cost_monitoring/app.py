@@ -1,12 +1,15 @@
+import hashlib
+import json
 from datetime import timedelta
 
+import orjson
 import requests
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.responses import Response
 from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
 from .const_usage import USAGE_MAP
-from .date_utils import get_now_date, parse_from_to_in_query_params
+from .date_utils import DateRange, get_now_date, parse_from_to_in_query_params
 from .logs import get_logger
 from .metrics import MetricsMiddleware
 from .query_cost_aws import (
@@ -29,9 +32,41 @@ app.add_middleware(MetricsMiddleware)
 logger = get_logger(__name__)
 
 
+# The index response never changes, so it is serialized once rather than for
+# every request
+INDEX_CONTENT = json.dumps(
+    {"message": "Welcome to the JupyterHub Cost Monitoring API"}
+).encode()
+
+
+def _cacheable_response(request: Request, content, date_range: DateRange) -> Response:
+    """
+    Create a JSON response for a date range that browsers and proxies can cache.
+
+    Responses are cached for 5 minutes. AWS can still revise estimated costs
+    for past dates, so responses for date ranges ending before the current
+    date aren't cached for longer, but may be served stale for up to an hour
+    while they are revalidated, matching how long the app caches estimated
+    costs. Responses including the current date aren't served stale, as costs
+    and usage for it are still coming in. An ETag header lets clients
+    revalidate cached responses, and a 304 response is returned if it matches.
+    """
+    body = orjson.dumps(content)
+    etag = f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+    if date_range.normalized_end_date < get_now_date():
+        cache_control = "public, max-age=300, stale-while-revalidate=3600"
+    else:
+        cache_control = "public, max-age=300"
+    headers = {"Cache-Control": cache_control, "ETag": etag}
+
+    if request.headers.get("If-None-Match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
 @app.get("/")
 def index():
-    return {"message": "Welcome to the JupyterHub Cost Monitoring API"}
+    return Response(INDEX_CONTENT, media_type="application/json")
 
 
 @app.get("/health/ready")
@@ -44,6 +79,7 @@ def ready():
 
 @app.get("/hub-names")
 def hub_names(
+    request: Request,
     from_date: str | None = Query(
         None, alias="from", description="Start date in YYYY-MM-DDTHH:MMZ format"
     ),
@@ -58,10 +94,12 @@ def hub_names(
     date_range = parse_from_to_in_query_params(from_date, to_date)
 
     try:
-        return query_hub_names(date_range)
+        names = query_hub_names(date_range)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"{e}")
 
+    return _cacheable_response(request, names, date_range)
+
 
 @app.get("/component-names")
 def component_names():
@@ -76,6 +114,7 @@ def component_names():
 
 @app.get("/total-costs")
 def total_costs(
+    request: Request,
     from_date: str | None = Query(
         None, alias="from", description="Start date in YYYY-MM-DDTHH:MMZ format"
     ),
@@ -90,10 +129,12 @@ def total_costs(
     date_range = parse_from_to_in_query_params(from_date, to_date)
 
     try:
-        return query_total_costs(date_range)
+        costs = query_total_costs(date_range)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"{e}")
 
+    return _cacheable_response(request, costs, date_range)
+
 
 @app.get("/user-groups")
 def user_groups(
@@ -182,6 +223,7 @@ def users_with_no_groups(
 
 @app.get("/total-costs-per-hub")
 def total_costs_per_hub(
+    request: Request,
     from_date: str | None = Query(
         None, alias="from", description="Start date in YYYY-MM-DDTHH:MMZ format"
     ),
@@ -196,13 +238,16 @@ def total_costs_per_hub(
     date_range = parse_from_to_in_query_params(from_date, to_date)
 
     try:
-        return query_total_costs_per_hub(date_range)
+        costs = query_total_costs_per_hub(date_range)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"{e}")
 
+    return _cacheable_response(request, costs, date_range)
+
 
 @app.get("/total-costs-per-component")
 def total_costs_per_component(
+    request: Request,
     from_date: str | None = Query(
         None, alias="from", description="Start date in YYYY-MM-DDTHH:MMZ format"
     ),
@@ -226,13 +271,16 @@ def total_costs_per_component(
         component = None
 
     try:
-        return query_total_costs_per_component(date_range, hub, component)
+        costs = query_total_costs_per_component(date_range, hub, component)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"{e}")
 
+    return _cacheable_response(request, costs, date_range)
+
 
 @app.get("/total-costs-per-group")
 def total_costs_per_group(
+    request: Request,
     from_date: str | None = Query(
         None, alias="from", description="Start date in YYYY-MM-DDTHH:MMZ format"
     ),
@@ -247,16 +295,19 @@ def total_costs_per_group(
     date_range = parse_from_to_in_query_params(from_date, to_date)
 
     try:
-        return query_total_costs_per_group(date_range)
+        costs = query_total_costs_per_group(date_range)
     except requests.exceptions.HTTPError as e:
         response = e.response
         raise HTTPException(status_code=response.status_code, detail=response.text)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"{e}")
 
+    return _cacheable_response(request, costs, date_range)
+
 
 @app.get("/costs-per-user")
 def costs_per_user(
+    request: Request,
     from_date: str | None = Query(
         None, alias="from", description="Start date in YYYY-MM-DDTHH:MMZ format"
     ),
@@ -326,11 +377,12 @@ def costs_per_user(
             raise HTTPException(status_code=500, detail=f"{e}")
         results.extend(per_user_costs)
 
-    return results
+    return _cacheable_response(request, results, date_range)
 
 
 @app.get("/total-usage")
 def total_usage(
+    request: Request,
     from_date: str | None = Query(
         None, alias="from", description="Start date in YYYY-MM-DDTHH:MMZ format"
     ),
@@ -359,13 +411,15 @@ def total_usage(
         user = None
 
     try:
-        return query_usage(date_range, hub, component, user)
+        usage = query_usage(date_range, hub, component, user)
     except requests.exceptions.HTTPError as e:
         response = e.response
         raise HTTPException(status_code=response.status_code, detail=response.text)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"{e}")
 
+    return _cacheable_response(request, usage, date_range)
+
 
 @app.get("/metrics")
 def metrics():
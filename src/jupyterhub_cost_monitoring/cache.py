@@ -6,10 +6,22 @@ https://stackoverflow.com/a/73026174/2220152.
 A limitation of this is implementation is that it can't be used on functions
 accepting lists etc, even if the functions we have only have lists with hashable
 content that could be compared and concluded equal.
+
+The persistent_cache decorator complements this with an on-disk cache, which
+accepts any JSON serializable arguments and is kept across restarts and shared
+by processes using the same cache directory.
 """
 
+import hashlib
+import json
+import os
 import time
-from functools import lru_cache
+from functools import cache, lru_cache, wraps
+
+import diskcache
+
+# The on-disk cache is disabled unless a directory has been configured for it
+CACHE_DIR = os.environ.get("COST_MONITORING_CACHE_DIR", "")
 
 
 def ttl_lru_cache(seconds_to_live: int = 3600, maxsize: int = 128):
@@ -29,3 +41,50 @@ def ttl_lru_cache(seconds_to_live: int = 3600, maxsize: int = 128):
         )
 
     return wrapper
+
+
+@cache
+def get_persistent_cache() -> diskcache.Cache | None:
+    """
+    Get the on-disk cache, or None if no cache directory is configured.
+    """
+    if not CACHE_DIR:
+        return None
+    return diskcache.Cache(CACHE_DIR)
+
+
+def persistent_cache(expire):
+    """
+    On-disk caching keyed by a hash of the function name and its arguments.
+
+    Args:
+        expire: Seconds to keep a result for, or a function returning that
+                number of seconds when passed the result to cache.
+    """
+
+    def wrapper(func):
+        @wraps(func)
+        def inner(*args, **kwargs):
+            disk_cache = get_persistent_cache()
+            if disk_cache is None:
+                return func(*args, **kwargs)
+
+            key = hashlib.blake2b(
+                json.dumps(
+                    [func.__module__, func.__qualname__, args, kwargs],
+                    sort_keys=True,
+                ).encode()
+            ).hexdigest()
+            result = disk_cache.get(key)
+            if result is None:
+                result = func(*args, **kwargs)
+                disk_cache.set(
+                    key,
+                    result,
+                    expire=expire(result) if callable(expire) else expire,
+                )
+            return result
+
+        return inner
+
+    return wrapper
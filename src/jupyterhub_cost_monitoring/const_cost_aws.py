@@ -117,6 +117,16 @@ FILTER_HOME_STORAGE_COSTS = {
     }
 }
 
+# EBS volumes and snapshots are reported under the EC2 - Other service, which
+# is mapped to the compute component
+FILTER_EC2_OTHER_COSTS = {
+    "Dimensions": {
+        "Key": "SERVICE",
+        "Values": ["EC2 - Other"],
+        "MatchOptions": ["EQUALS"],
+    },
+}
+
 
 # Some costs like costs associated with core nodes, hub database storage, and support components
 # (Prometheus, Grafana, Alertmanager) are not tied to any specific hub or user.
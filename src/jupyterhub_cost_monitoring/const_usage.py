@@ -2,10 +2,20 @@
 Constants used to query Prometheus for JupyterHub usage data.
 """
 
-MEMORY_REQUESTS_PER_USER = """
+
+def _compact_query(query: str) -> str:
+    """
+    Collapse the whitespace used to lay out a query, as queries are sent URL
+    encoded in the query string of every request to Prometheus.
+    """
+    return " ".join(query.split())
+
+
+MEMORY_REQUESTS_PER_USER = _compact_query(
+    """
     label_replace(
         sum(
-        kube_pod_container_resource_requests{resource="memory"} * on (namespace, pod)
+        kube_pod_container_resource_requests{resource="memory", ${namespace_matcher}} * on (namespace, pod)
         group_left(annotation_hub_jupyter_org_username) group(
             kube_pod_annotations{annotation_hub_jupyter_org_username!=""}
             ) by (pod, namespace, annotation_hub_jupyter_org_username)
@@ -13,14 +23,20 @@ MEMORY_REQUESTS_PER_USER = """
         "username", "$1", "annotation_hub_jupyter_org_username", "(.*)"
     )
 """
+)
 
-STORAGE_USAGE_PER_USER = """
+STORAGE_USAGE_PER_USER = _compact_query(
+    """
     label_replace(
-        sum(dirsize_total_size_bytes{namespace!=""}) by (namespace, directory),
+        sum(dirsize_total_size_bytes{${namespace_matcher}}) by (namespace, directory),
         "username", "$1", "directory", "(.*)"
     )
 """
+)
 
+# Usage queries are string.Template templates, where ${namespace_matcher} is
+# substituted with a label matcher for the namespace of a hub, or of all hubs.
+#
 # Time step for Prometheus queries: "5m" for compute since user pods come and go on this timescale, "1d" for home storage since we do not need to track changes in storage usage more frequently than daily.
 USAGE_MAP = {
     "compute": {
@@ -33,6 +49,14 @@ USAGE_MAP = {
     },
 }
 
-USER_GROUP_INFO = """
+# Minimum time step for Prometheus queries over date ranges longer than the given number of days. This bounds the number of samples returned per user for long date ranges, while each step still divides a day evenly so that every day is sampled the same number of times.
+MIN_STEP_BY_DATE_RANGE_DAYS = {
+    62: "15m",
+    366: "1h",
+}
+
+USER_GROUP_INFO = _compact_query(
+    """
     group(jupyterhub_user_group_info) by (namespace, username, username_escaped, usergroup)
     """
+)
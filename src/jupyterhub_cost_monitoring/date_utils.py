@@ -83,8 +83,8 @@ class DateRange:
             Tuple of (start_date_str, end_date_str) formatted for AWS Cost Explorer
         """
         return (
-            self.normalized_start_date.strftime("%Y-%m-%d"),
-            (self.normalized_end_date + timedelta(days=1)).strftime("%Y-%m-%d"),
+            self.normalized_start_date.date().isoformat(),
+            (self.normalized_end_date + timedelta(days=1)).date().isoformat(),
         )
 
     @property
@@ -103,6 +103,27 @@ class DateRange:
             self.normalized_end_date.isoformat(),
         )
 
+    def split_by_month(self) -> list["DateRange"]:
+        """
+        Split into the calendar months this date range overlaps.
+
+        Each month is covered in full, up to the current date, so that queries
+        for different date ranges within the same months can share cached
+        results for those months.
+
+        Returns:
+            List of DateRange objects, one per calendar month, sorted by date
+        """
+        now_date = get_now_date()
+        month_ranges = []
+        month_start = self.normalized_start_date.replace(day=1)
+        while month_start <= self.normalized_end_date:
+            next_month_start = (month_start + timedelta(days=32)).replace(day=1)
+            month_end = min(next_month_start - timedelta(days=1), now_date)
+            month_ranges.append(DateRange(start_date=month_start, end_date=month_end))
+            month_start = next_month_start
+        return month_ranges
+
 
 def parse_from_to_in_query_params(
     from_date: str | None = None,
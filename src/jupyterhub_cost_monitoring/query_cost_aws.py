@@ -2,17 +2,24 @@
 Queries to AWS Cost Explorer to get different kinds of cost data.
 """
 
-import copy
 import functools
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
 from pprint import pformat
 
 import boto3
+import numpy as np
+import pandas as pd
 import requests
+from botocore.config import Config
 
-from .cache import ttl_lru_cache
+from .cache import persistent_cache, ttl_lru_cache
 from .const_cost_aws import (
     FILTER_ATTRIBUTABLE_COSTS,
     FILTER_CORE_COSTS,
+    FILTER_EC2_OTHER_COSTS,
     FILTER_HOME_STORAGE_COSTS,
     FILTER_USAGE_COSTS,
     GRANULARITY_DAILY,
@@ -23,29 +30,109 @@ from .const_cost_aws import (
 )
 from .date_utils import DateRange
 from .logs import get_logger
-from .query_usage import _filter_json, query_usage, query_user_groups
+from .query_usage import query_usage_frame, query_user_groups
 
 logger = get_logger(__name__)
-aws_ce_client = boto3.client("ce")
+
+
+_ce_client_lock = threading.Lock()
+
+
+def _get_ce_client():
+    """
+    Get the AWS Cost Explorer client, created on first use rather than on
+    import so that starting the app and serving endpoints not querying AWS,
+    like the readiness probe, doesn't wait for AWS credentials to be resolved.
+
+    The first use is typically from several aws_ce_executor threads at once,
+    and creating boto3 clients isn't thread-safe, so the client is created
+    while holding a lock and only once.
+    """
+    with _ce_client_lock:
+        return _create_ce_client()
 
 
 @functools.cache
+def _create_ce_client():
+    """
+    Create the AWS Cost Explorer client from a dedicated boto3 session, rather
+    than boto3's default session shared with other clients.
+
+    Cost Explorer throttles bursts of requests, like those made concurrently
+    via aws_ce_executor, so the adaptive retry mode is used to back off client
+    side. The connection pool is large enough for each of the executor's
+    threads to keep its own connection alive.
+    """
+    return boto3.session.Session().client(
+        "ce",
+        config=Config(
+            retries={"mode": "adaptive", "max_attempts": 6},
+            max_pool_connections=8,
+            tcp_keepalive=True,
+            connect_timeout=5,
+            read_timeout=30,
+        ),
+    )
+
+
+# Filters used by most cost queries. These are shared by all queries and must
+# not be modified, use _add_hub_filter to get a filter for a specific hub.
+_FILTER_ATTRIBUTABLE = {
+    "And": [
+        FILTER_USAGE_COSTS,
+        FILTER_ATTRIBUTABLE_COSTS,
+    ]
+}
+_FILTER_ATTRIBUTABLE_HOME_STORAGE = {
+    "And": _FILTER_ATTRIBUTABLE["And"]
+    + [FILTER_HOME_STORAGE_COSTS, FILTER_EC2_OTHER_COSTS]
+}
+_FILTER_ATTRIBUTABLE_CORE = {"And": _FILTER_ATTRIBUTABLE["And"] + [FILTER_CORE_COSTS]}
+
+# Cost Explorer requests are blocking and independent of each other, so queries
+# that need several of them submit them to this pool to run concurrently.
+aws_ce_executor = ThreadPoolExecutor(max_workers=4)
+
+
+# Service names not categorized as a component that have been warned about
+_uncategorized_service_names: set[str] = set()
+
+
 def _get_component_name(service_name):
-    if service_name in SERVICE_COMPONENT_MAP:
-        return SERVICE_COMPONENT_MAP[service_name]
-    else:
-        # only printed once per service name thanks to memoization
+    component_name = SERVICE_COMPONENT_MAP.get(service_name)
+    if component_name is not None:
+        return component_name
+    if service_name not in _uncategorized_service_names:
+        # only printed once per service name
+        _uncategorized_service_names.add(service_name)
         logger.warning(f"Service '{service_name}' not categorized as a component yet")
-        return "other"
+    return "other"
+
 
+def _cost_explorer_cache_expiry(response):
+    """
+    Seconds to keep a Cost Explorer response for in the on-disk cache.
+
+    AWS flags costs that may still be revised as estimated, so responses
+    including estimated costs are only kept for as long as the in-memory
+    caches are, while responses with only final costs are kept for 30 days.
+    """
+    if any(e.get("Estimated") for e in response["ResultsByTime"]):
+        return 3600
+    return 30 * 24 * 3600
 
+
+@persistent_cache(expire=_cost_explorer_cache_expiry)
 def query_aws_cost_explorer(metrics, granularity, from_date, to_date, filter, group_by):
     """
     Function meant to be responsible for making the API call and handling
     pagination etc. Currently pagination isn't handled.
+
+    Responses are cached on disk if a cache directory is configured, as each
+    request to the Cost Explorer API is billed.
     """
     # ref: https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/ce/client/get_cost_and_usage.html#get-cost-and-usage
-    response = aws_ce_client.get_cost_and_usage(
+    response = _get_ce_client().get_cost_and_usage(
         Metrics=metrics,
         Granularity=granularity,
         TimePeriod={"Start": from_date, "End": to_date},
@@ -64,6 +151,47 @@ def query_aws_cost_explorer(metrics, granularity, from_date, to_date, filter, gr
     return response
 
 
+def query_aws_cost_explorer_by_month(
+    metrics, granularity, date_range, filter, group_by
+):
+    """
+    Query AWS Cost Explorer one calendar month at a time, and combine the
+    results for the days in the given date range.
+
+    Querying whole months lets queries for overlapping date ranges reuse the
+    cached responses for the months they have in common, instead of each
+    distinct date range leading to a new billed request.
+
+    Args:
+        date_range: DateRange object containing the time period for the query
+        Other arguments are passed on to query_aws_cost_explorer.
+
+    Returns:
+        Dict with the 'ResultsByTime' entries for the days in the date range
+    """
+    # Use AWS-formatted dates (exclusive end date) for Cost Explorer API
+    from_date, to_date = date_range.aws_range
+
+    results_by_time = []
+    for month_range in date_range.split_by_month():
+        month_from_date, month_to_date = month_range.aws_range
+        response = query_aws_cost_explorer(
+            metrics=metrics,
+            granularity=granularity,
+            from_date=month_from_date,
+            to_date=month_to_date,
+            filter=filter,
+            group_by=group_by,
+        )
+        results_by_time.extend(
+            e
+            for e in response["ResultsByTime"]
+            if from_date <= e["TimePeriod"]["Start"] < to_date
+        )
+
+    return {"ResultsByTime": results_by_time}
+
+
 @ttl_lru_cache(seconds_to_live=3600)
 def query_hub_names(date_range: DateRange):
     """
@@ -79,7 +207,7 @@ def query_hub_names(date_range: DateRange):
     from_date, to_date = date_range.aws_range
 
     # ref: https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/ce/client/get_tags.html
-    response = aws_ce_client.get_tags(
+    response = _get_ce_client().get_tags(
         TimePeriod={"Start": from_date, "End": to_date},
         TagKey="2i2c:hub-name",
     )
@@ -103,14 +231,16 @@ def query_total_costs(date_range: DateRange):
     Returns:
         List of cost entries with 'date', 'cost', and 'name' fields, sorted by date
     """
-    total_account_costs = _query_total_costs(
-        date_range, add_attributable_costs_filter=False
+    total_account_costs = aws_ce_executor.submit(
+        _query_total_costs, date_range, add_attributable_costs_filter=False
     )
-    total_attributable_costs = _query_total_costs(
-        date_range, add_attributable_costs_filter=True
+    total_attributable_costs = aws_ce_executor.submit(
+        _query_total_costs, date_range, add_attributable_costs_filter=True
     )
 
-    processed_response = total_account_costs + total_attributable_costs
+    processed_response = (
+        total_account_costs.result() + total_attributable_costs.result()
+    )
 
     # the infinity plugin appears needs us to sort by date, otherwise it fails
     # to distinguish time series by the name field for some reason
@@ -136,24 +266,15 @@ def _query_total_costs(date_range: DateRange, add_attributable_costs_filter):
     """
     if add_attributable_costs_filter:
         name = "attributable"
-        filter = {
-            "And": [
-                FILTER_USAGE_COSTS,
-                FILTER_ATTRIBUTABLE_COSTS,
-            ]
-        }
+        filter = _FILTER_ATTRIBUTABLE
     else:
         name = "account"
         filter = FILTER_USAGE_COSTS
 
-    # Use AWS-formatted dates (exclusive end date) for Cost Explorer API
-    from_date, to_date = date_range.aws_range
-
-    response = query_aws_cost_explorer(
+    response = query_aws_cost_explorer_by_month(
         metrics=[METRICS_UNBLENDED_COST],
         granularity=GRANULARITY_DAILY,
-        from_date=from_date,
-        to_date=to_date,
+        date_range=date_range,
         filter=filter,
         group_by=[],
     )
@@ -182,20 +303,11 @@ def query_total_costs_per_hub(date_range: DateRange):
     Returns:
         List of cost entries with 'date', 'cost', and 'name' (hub name) fields
     """
-    # Use AWS-formatted dates (exclusive end date) for Cost Explorer API
-    from_date, to_date = date_range.aws_range
-
-    response = query_aws_cost_explorer(
+    response = query_aws_cost_explorer_by_month(
         metrics=[METRICS_UNBLENDED_COST],
         granularity=GRANULARITY_DAILY,
-        from_date=from_date,
-        to_date=to_date,
-        filter={
-            "And": [
-                FILTER_USAGE_COSTS,
-                FILTER_ATTRIBUTABLE_COSTS,
-            ]
-        },
+        date_range=date_range,
+        filter=_FILTER_ATTRIBUTABLE,
         group_by=[
             GROUP_BY_HUB_TAG,
         ],
@@ -208,7 +320,7 @@ def query_total_costs_per_hub(date_range: DateRange):
                 {
                     "date": e["TimePeriod"]["Start"],
                     "cost": f"{float(g['Metrics']['UnblendedCost']['Amount']):.2f}",
-                    "name": g["Keys"][0].split("$", maxsplit=1)[1] or "support",
+                    "name": g["Keys"][0].partition("$")[2] or "support",
                 }
                 for g in e["Groups"]
             ]
@@ -217,165 +329,156 @@ def query_total_costs_per_hub(date_range: DateRange):
     return processed_response
 
 
-def _process_home_storage_costs(entries_by_date, home_storage_ebs_cost_response):
-    """
-    Helper function to get home storage costs and deduct this from the compute component costs.
-    This is because EBS volumes are included in the EC2 - Other service, which is mapped to the
-    compute component by default.
-
-    Args:
-        entries_by_date: Dictionary indexed by date containing component entries
-        home_storage_ebs_cost_response: AWS Cost Explorer response for home storage EBS costs
-    """
-    for home_e in home_storage_ebs_cost_response["ResultsByTime"]:
-        date = home_e["TimePeriod"]["Start"]
-
-        # Calculate total home storage cost for this date
-        home_storage_cost = 0.0
-        for g in home_e["Groups"]:
-            if g["Keys"][0] == "EC2 - Other":
-                home_storage_cost += float(g["Metrics"]["UnblendedCost"]["Amount"])
-
-        if home_storage_cost > 0:
-            date_entries = entries_by_date.get(date, {})
-
-            # Subtract from compute component (EC2 - Other maps to compute)
-            compute_entry = date_entries.get("compute")
-            if compute_entry:
-                current_compute_cost = float(compute_entry["cost"])
-                new_compute_cost = max(0.0, current_compute_cost - home_storage_cost)
-                compute_entry["cost"] = f"{new_compute_cost:.2f}"
-                logger.debug(
-                    f"Adjusted compute cost for {date}: {current_compute_cost:.2f} -> {new_compute_cost:.2f}"
-                )
-
-            # Add to home storage component
-            home_storage_entry = date_entries.get("home storage")
-            if home_storage_entry:
-                current_home_storage_cost = float(home_storage_entry["cost"])
-                new_home_storage_cost = current_home_storage_cost + home_storage_cost
-                home_storage_entry["cost"] = f"{new_home_storage_cost:.2f}"
-                logger.debug(
-                    f"Updated home storage cost for {date}: {current_home_storage_cost:.2f} -> {new_home_storage_cost:.2f}"
-                )
-            else:
-                # Create new home storage entry if it doesn't exist
-                new_entry = {
-                    "date": date,
-                    "cost": f"{home_storage_cost:.2f}",
-                    "component": "home storage",
-                }
-                # Update index
-                if date not in entries_by_date:
-                    entries_by_date[date] = {}
-                entries_by_date[date]["home storage"] = new_entry
-                logger.debug(
-                    f"Added new home storage entry for {date}: {home_storage_cost:.2f}"
-                )
-
-
-def _add_hub_filter(filter_dict: dict, hub_name: str = None) -> None:
+def _add_hub_filter(filter_dict: dict, hub_name: str = None) -> dict:
     """
     Add hub-specific filtering to a given filter dictionary.
 
+    The given filter dictionary isn't modified, as it may be one of the filters
+    shared at module scope.
+
     Args:
-        filter_dict: The filter dictionary to modify (must have "And" key)
+        filter_dict: The filter dictionary to add to (must have "And" key)
         hub_name: The hub name to filter by. If "support", filters for absent hub tags.
                  If a specific name, filters for that hub. If None, no filter added.
+
+    Returns:
+        A new filter dictionary with the hub filter added, or the given filter
+        dictionary if no hub filter is added
     """
     if hub_name == "support":
-        filter_dict["And"].append(
-            {
-                "Tags": {
-                    "Key": "2i2c:hub-name",
-                    "MatchOptions": ["ABSENT"],
-                },
-            }
-        )
+        hub_filter = {
+            "Tags": {
+                "Key": "2i2c:hub-name",
+                "MatchOptions": ["ABSENT"],
+            },
+        }
     elif hub_name:
-        filter_dict["And"].append(
-            {
-                "Tags": {
-                    "Key": "2i2c:hub-name",
-                    "Values": [hub_name],
-                    "MatchOptions": ["EQUALS"],
-                },
-            }
-        )
+        hub_filter = {
+            "Tags": {
+                "Key": "2i2c:hub-name",
+                "Values": [hub_name],
+                "MatchOptions": ["EQUALS"],
+            },
+        }
+    else:
+        return filter_dict
+    return {"And": filter_dict["And"] + [hub_filter]}
 
 
-def _create_base_filter() -> dict:
+def _round_cents(costs):
     """
-    Create the base filter used for most cost queries.
+    Round an array of costs to cents.
 
-    Returns:
-        Base filter dictionary with usage and attributable cost filters
+    Python's round is used as np.round can round differently at ties.
     """
-    return {
-        "And": [
-            FILTER_USAGE_COSTS,
-            FILTER_ATTRIBUTABLE_COSTS,
-        ]
-    }
+    return np.reshape([round(cost, 2) for cost in costs.ravel().tolist()], costs.shape)
 
 
-def _process_core_costs(entries_by_date, core_cost_response):
+def _coalesce_component_costs(response, dates, component=None, components=()):
     """
-    Helper function to get core infrastructure costs and deduct this from compute costs.
+    Coalesce service costs from a Cost Explorer response into component costs.
 
-    This is because core node compute and root volumes, support EBS volumes
-    and NAT Gateway (if it exists), are mapped to compute by default under
-    the EC2 - Other service.
+    Costs are kept as a structure of arrays, with a row per date and a column
+    per component, so that they can be adjusted for all dates at once.
 
     Args:
-        entries_by_date: Dictionary indexed by date containing component entries
-        core_cost_response: AWS Cost Explorer response for core costs
+        response: AWS Cost Explorer response grouped by service
+        dates: Sorted list of dates, one per row of the returned arrays
+        component: If set, only costs for this component are included
+        components: Components to allocate columns for even if the response
+                    has no costs for them, so that costs can be moved to them
+                    in place
+
+    Returns:
+        Tuple of (components, costs, order), where components is the list of
+        component names per column, costs is an array of costs rounded to
+        cents, and order is an array with the position of each component in
+        the order components are first reported in for each date, or -1 for
+        components without costs reported for a date
+    """
+    date_index = {date: i for i, date in enumerate(dates)}
+    component_index = {}
+    rows, columns, amounts = [], [], []
+    for e in response["ResultsByTime"]:
+        for g in e["Groups"]:
+            component_name = _get_component_name(g["Keys"][0])
+            if component and component_name != component:
+                continue
+            rows.append(date_index[e["TimePeriod"]["Start"]])
+            columns.append(
+                component_index.setdefault(component_name, len(component_index))
+            )
+            amounts.append(g["Metrics"]["UnblendedCost"]["Amount"])
+    for component_name in components:
+        component_index.setdefault(component_name, len(component_index))
+
+    rows = np.array(rows, dtype=np.intp)
+    columns = np.array(columns, dtype=np.intp)
+    costs = np.zeros((len(dates), len(component_index)))
+    np.add.at(costs, (rows, columns), np.array(amounts, dtype=np.float64))
+    order = np.full(costs.shape, -1, dtype=np.intp)
+    num_reported = np.zeros(len(dates), dtype=np.intp)
+    for row, column in dict.fromkeys(zip(rows.tolist(), columns.tolist())):
+        order[row, column] = num_reported[row]
+        num_reported[row] += 1
+
+    return list(component_index), _round_cents(costs), order
+
+
+def _sum_costs_by_date(response, dates):
     """
-    logger.debug(
-        f"Processing core costs: {pformat(core_cost_response['ResultsByTime'])}"
+    Sum the costs from a Cost Explorer response for each date.
+
+    Args:
+        response: AWS Cost Explorer response grouped by service
+        dates: Sorted list of dates, one per element of the returned array
+
+    Returns:
+        Array of total costs per date
+    """
+    date_index = {date: i for i, date in enumerate(dates)}
+    rows, amounts = [], []
+    for e in response["ResultsByTime"]:
+        for g in e["Groups"]:
+            rows.append(date_index[e["TimePeriod"]["Start"]])
+            amounts.append(g["Metrics"]["UnblendedCost"]["Amount"])
+
+    totals = np.zeros(len(dates))
+    np.add.at(
+        totals, np.array(rows, dtype=np.intp), np.array(amounts, dtype=np.float64)
     )
-    for core_e in core_cost_response["ResultsByTime"]:
-        date = core_e["TimePeriod"]["Start"]
-
-        # Calculate total core cost for this date
-        core_cost = 0.0
-        for g in core_e["Groups"]:
-            core_cost += float(g["Metrics"]["UnblendedCost"]["Amount"])
-
-        if core_cost > 0:
-            date_entries = entries_by_date.get(date, {})
-
-            # Subtract from compute component (EC2 - Other maps to compute)
-            compute_entry = date_entries.get("compute")
-            if compute_entry:
-                current_compute_cost = float(compute_entry["cost"])
-                new_compute_cost = max(0.0, current_compute_cost - core_cost)
-                compute_entry["cost"] = f"{new_compute_cost:.2f}"
-                logger.debug(
-                    f"Adjusted compute cost for {date} (core cost): {current_compute_cost:.2f} -> {new_compute_cost:.2f}"
-                )
-
-            # Add to core component
-            core_entry = date_entries.get("core")
-            if core_entry:
-                current_core_cost = float(core_entry["cost"])
-                new_core_cost = current_core_cost + core_cost
-                core_entry["cost"] = f"{new_core_cost:.2f}"
-                logger.debug(
-                    f"Updated core cost for {date}: {current_core_cost:.2f} -> {new_core_cost:.2f}"
-                )
-            else:
-                # Create new core entry if it doesn't exist
-                new_entry = {
-                    "date": date,
-                    "cost": f"{core_cost:.2f}",
-                    "component": "core",
-                }
-                # Update index
-                if date not in entries_by_date:
-                    entries_by_date[date] = {}
-                entries_by_date[date]["core"] = new_entry
-                logger.debug(f"Added new core entry for {date}: {core_cost:.2f}")
+    return totals
+
+
+def _move_costs_from_compute(components, costs, order, to_component, moved_costs):
+    """
+    Deduct costs per date from the compute component and add them to another,
+    updating costs and order in place. Components added for a date are
+    ordered after the components already reported for it.
+
+    This is because EBS volumes, core nodes and the NAT gateway are included in
+    the EC2 - Other service, which is mapped to the compute component by
+    default. Compute costs are not reduced below zero.
+
+    Args:
+        components, costs, order: As returned by _coalesce_component_costs,
+                                  with a column allocated for to_component
+        to_component: The component to move the costs to
+        moved_costs: Array of costs to move per date
+    """
+    moved = moved_costs > 0
+    if "compute" in components:
+        c = components.index("compute")
+        adjusted = moved & (order[:, c] >= 0)
+        costs[adjusted, c] = _round_cents(
+            np.maximum(0.0, costs[adjusted, c] - moved_costs[adjusted])
+        )
+
+    # Dates without costs for to_component have zero costs in its column
+    t = components.index(to_component)
+    costs[moved, t] = _round_cents(costs[moved, t] + moved_costs[moved])
+    added = moved & (order[:, t] < 0)
+    order[added, t] = order[added].max(axis=1) + 1
 
 
 @ttl_lru_cache(seconds_to_live=3600)
@@ -397,118 +500,70 @@ def query_total_costs_per_component(
     Returns:
         List of dicts with keys: date, cost, component
     """
-    # Create base filter and add hub-specific filtering
-    base_filter = _create_base_filter()
-    _add_hub_filter(base_filter, hub_name)
-
-    # Use AWS-formatted dates (exclusive end date) for Cost Explorer API
-    from_date, to_date = date_range.aws_range
-
-    response = query_aws_cost_explorer(
-        metrics=[METRICS_UNBLENDED_COST],
-        granularity=GRANULARITY_DAILY,
-        from_date=from_date,
-        to_date=to_date,
-        filter=base_filter,
-        group_by=[GROUP_BY_SERVICE_DIMENSION],
-    )
-
-    processed_response = []
-
-    logger.debug(f"Processing response: {pformat(response['ResultsByTime'])}")
-
-    for e in response["ResultsByTime"]:
-        # coalesce service costs to component costs
-        component_costs = {}
-        for g in e["Groups"]:
-            service_name = g["Keys"][0]
-            component_name = _get_component_name(service_name)
-            cost = float(g["Metrics"]["UnblendedCost"]["Amount"])
-            component_costs[component_name] = (
-                component_costs.get(component_name, 0.0) + cost
-            )
-
-        # Filter to specific component if requested
-        logger.debug(f"Component costs before filtering: {component_costs}")
-        if component:
-            component_costs = {
-                k: v for k, v in component_costs.items() if k == component
-            }
-
-        processed_response.extend(
-            [
-                {
-                    "date": e["TimePeriod"]["Start"],
-                    "cost": f"{cost:.2f}",
-                    "component": component_name,
-                }
-                for component_name, cost in component_costs.items()
-            ]
-        )
-
-    # Create index for faster lookups by date and component name
-    entries_by_date = {}
-    for entry in processed_response:
-        date = entry["date"]
-        if date not in entries_by_date:
-            entries_by_date[date] = {}
-        entries_by_date[date][entry["component"]] = entry
-
-    logger.debug(f"Entries by date before deduplication: {entries_by_date}\n\n")
+    # Create filters for the base, home storage and core cost queries up front,
+    # so that the queries can be submitted concurrently
+    base_filter = _add_hub_filter(_FILTER_ATTRIBUTABLE, hub_name)
 
     # EC2 - Other is a service that can include costs for EBS volumes and snapshots
     # By default, these costs are mapped to the compute component, but
     # a part of the costs from EBS volumes and snapshots can be attributed to "home storage" too
-    # so we need to query those costs separately and adjust the compute costs
+    # so we need to query those costs separately and adjust the compute costs.
+    # Only the EC2 - Other part of home storage costs is mapped to compute.
+    home_storage_filter = _add_hub_filter(_FILTER_ATTRIBUTABLE_HOME_STORAGE, hub_name)
+
+    # Core costs (core nodes, hub databases, support components) should be
+    # subtracted from compute and added to a "core" component
+    core_cost_filter = _add_hub_filter(_FILTER_ATTRIBUTABLE_CORE, hub_name)
+
+    futures = [
+        aws_ce_executor.submit(
+            query_aws_cost_explorer_by_month,
+            metrics=[METRICS_UNBLENDED_COST],
+            granularity=GRANULARITY_DAILY,
+            date_range=date_range,
+            filter=f,
+            group_by=[GROUP_BY_SERVICE_DIMENSION],
+        )
+        for f in [base_filter, home_storage_filter, core_cost_filter]
+    ]
+    response, home_storage_ebs_cost_response, core_cost_response = [
+        future.result() for future in futures
+    ]
 
-    # Create home storage filter using the same base filter and hub filtering
-    home_storage_filter = _create_base_filter()
-    _add_hub_filter(home_storage_filter, hub_name)
-    home_storage_filter["And"].append(FILTER_HOME_STORAGE_COSTS)
+    logger.debug(f"Processing response: {pformat(response['ResultsByTime'])}")
 
-    home_storage_ebs_cost_response = query_aws_cost_explorer(
-        metrics=[METRICS_UNBLENDED_COST],
-        granularity=GRANULARITY_DAILY,
-        from_date=from_date,
-        to_date=to_date,
-        filter=home_storage_filter,
-        group_by=[GROUP_BY_SERVICE_DIMENSION],
+    dates = sorted(
+        {
+            e["TimePeriod"]["Start"]
+            for r in [response, home_storage_ebs_cost_response, core_cost_response]
+            for e in r["ResultsByTime"]
+        }
     )
-
-    # Process home storage costs and adjust compute costs accordingly
-    _process_home_storage_costs(entries_by_date, home_storage_ebs_cost_response)
-
-    logger.debug(
-        f"Entries by date after home storage processing: {entries_by_date}\n\n"
+    components, costs, order = _coalesce_component_costs(
+        response, dates, component, components=["home storage", "core"]
     )
+    logger.debug(f"Component costs for {components}:\n{costs}")
 
-    # Query core costs (core nodes, hub databases, support components)
-    # These should be subtracted from compute and added to a "core" component
-    core_cost_filter = _create_base_filter()
-    _add_hub_filter(core_cost_filter, hub_name)
-    core_cost_filter["And"].append(FILTER_CORE_COSTS)
-
-    core_cost_response = query_aws_cost_explorer(
-        metrics=[METRICS_UNBLENDED_COST],
-        granularity=GRANULARITY_DAILY,
-        from_date=from_date,
-        to_date=to_date,
-        filter=core_cost_filter,
-        group_by=[GROUP_BY_SERVICE_DIMENSION],
+    home_storage_costs = _sum_costs_by_date(home_storage_ebs_cost_response, dates)
+    _move_costs_from_compute(
+        components, costs, order, "home storage", home_storage_costs
     )
+    logger.debug(f"Component costs after home storage processing:\n{costs}")
 
-    # Process core costs and adjust compute costs accordingly
-    _process_core_costs(entries_by_date, core_cost_response)
-
-    logger.debug(f"Entries by date after core cost processing: {entries_by_date}\n\n")
+    core_costs = _sum_costs_by_date(core_cost_response, dates)
+    _move_costs_from_compute(components, costs, order, "core", core_costs)
+    logger.debug(f"Component costs after core cost processing:\n{costs}")
 
-    # Generate final response from index, sorted by date
-    final_response = []
-    for date in sorted(entries_by_date.keys()):
-        for _, entry in entries_by_date[date].items():
-            if component and entry["component"] != component:
-                continue
-            final_response.append(entry)
+    # Generate final response sorted by date, with the components of each date
+    # in the order they were reported in. Costs are kept as floats rounded to
+    # cents while being adjusted, and only formatted here.
+    rows, columns = np.nonzero(order >= 0)
+    by_date = np.lexsort((order[rows, columns], rows))
+    final_response = [
+        {"date": dates[i], "cost": f"{costs[i, j]:.2f}", "component": components[j]}
+        for i, j in zip(rows[by_date].tolist(), columns[by_date].tolist())
+        if not component or components[j] == component
+    ]
 
     return final_response
 
@@ -544,20 +599,35 @@ def query_total_costs_per_user(
         List of dicts with keys: date, hub, component, user, value (cost in USD)
         Results are sorted by date, hub, component, then value (highest cost first)
     """
-    # Get AWS cost data using the DateRange object
-    costs_per_component = query_total_costs_per_component(date_range, hub, component)
+    df = _query_total_costs_per_user_frame(
+        date_range, hub, component, user, usergroup, limit
+    )
+    return df.to_dict(orient="records")
 
-    costs_by_date = {}
-    for entry in costs_per_component:
-        costs_by_date.setdefault(entry["date"], {})[entry["component"]] = float(
-            entry["cost"]
-        )
+
+def _query_total_costs_per_user_frame(
+    date_range: DateRange,
+    hub: str = None,
+    component: str = None,
+    user: str = None,
+    usergroup: str = None,
+    limit: str = None,
+) -> pd.DataFrame:
+    """
+    Query total costs per user as described for query_total_costs_per_user,
+    as a DataFrame with a row per result.
+    """
+    # Get AWS cost data using the DateRange object
+    costs_per_component = pd.DataFrame(
+        query_total_costs_per_component(date_range, hub, component),
+        columns=["date", "cost", "component"],
+    )
 
     # Get user usage percentages from Prometheus using the same DateRange object
     # This ensures we query the same logical date range for both AWS and Prometheus,
     # accounting for their different date range semantics (exclusive vs inclusive)
     try:
-        usage_shares = query_usage(
+        usage_shares = query_usage_frame(
             date_range,
             hub_name=hub,
             component_name=component,
@@ -565,68 +635,58 @@ def query_total_costs_per_user(
         )
     except requests.exceptions.ConnectionError:
         raise
-    results = []
-    for entry in usage_shares:
-        d = entry["date"]
-        c = entry["component"]
-        usage_share = entry["value"]
-        if d in costs_by_date and c in costs_by_date[d]:
-            total_cost_for_component = costs_by_date[d][c]
-            entry["value"] = round(
-                usage_share * total_cost_for_component, 4
-            )  # Adjust usage share to cost
-            results.append(entry)
-    results = [x for x in results if x["hub"] != "binder"]  # Exclude binder hubs
-    user_groups = query_user_groups(date_range, hub, user)
-    seen = set()
-    list_groups = []
-    # Ensure uniquely keyed entries when double-counting group costs
-    for r in results:
-        matched = False
-        for entry in user_groups:
-            if r["hub"] == entry["hub"] and r["user"] == entry["username"]:
-                key = (
-                    r["date"],
-                    r["hub"],
-                    r["user"],
-                    r["component"],
-                    entry["usergroup"],
-                )
-                if key in seen:
-                    continue
-                seen.add(key)
-                if "usergroup" not in r:
-                    r["usergroup"] = entry["usergroup"]
-                    matched = True
-                else:
-                    r_copy = copy.deepcopy(r)
-                    r_copy["usergroup"] = entry["usergroup"]
-                    list_groups.append(r_copy)
-                    matched = True
-        if not matched:
-            key = (r["date"], r["hub"], r["user"], r["component"], "none")
-            if key not in seen:
-                seen.add(key)
-                r["usergroup"] = "none"
-    results.extend(list_groups)
+    # Adjust usage shares to costs, for the dates and components with costs
+    df = usage_shares.merge(costs_per_component, on=["date", "component"], how="left")
+    df = df[df["cost"].notna() & (df["hub"] != "binder")]  # Exclude binder hubs
+    # Python's round is used as np.round can round differently at ties
+    values = (df["value"] * df["cost"].astype(float)).tolist()
+    df = df.assign(value=[round(v, 4) for v in values]).drop(columns="cost")
+    user_groups = pd.DataFrame(
+        query_user_groups(date_range, hub, user),
+        columns=["hub", "username", "usergroup"],
+    )
+    # Repeat rows for each group of their user, so costs are double-counted
+    # towards all groups of a user, with users without groups in "none". Rows
+    # for a user's first group keep their position and rows for further groups
+    # follow them, in the order the groups are listed in.
+    groups = user_groups.drop_duplicates().rename(columns={"username": "user"})
+    groups["group_rank"] = groups.groupby(["hub", "user"], sort=False).cumcount()
+    df = (
+        df.reset_index(drop=True)
+        .rename_axis("row")
+        .reset_index()
+        .merge(groups, on=["hub", "user"], how="left")
+    )
+    df["usergroup"] = df["usergroup"].fillna("none")
+    df = (
+        df.assign(extra=df["group_rank"] > 0)
+        .sort_values(["extra", "row", "group_rank"], kind="stable")
+        .drop(columns=["extra", "row", "group_rank"])
+    )
     if limit:
         limit = int(limit)
-        user_costs = {}
-        for entry in results:
-            user_costs[entry["user"]] = (
-                user_costs.get(entry["user"], 0) + entry["value"]
-            )
-        top_users = sorted(user_costs.items(), key=lambda x: -x[1])[:limit]
-        top_user_set = {user for user, _ in top_users}
+        codes, users = pd.factorize(df["user"])
+        user_costs = np.bincount(codes, weights=df["value"].to_numpy())
+        top_users = heapq.nlargest(
+            limit, zip(users, user_costs.tolist()), key=itemgetter(1)
+        )
         logger.debug(f"Top users: {top_users}")
-        results = [entry for entry in results if entry["user"] in top_user_set]
-    results = _filter_json(
-        results, hub=hub, component=component, user=user, usergroup=usergroup
-    )
-    results.sort(
-        key=lambda x: (x["date"], x["hub"], x["component"], -float(x["value"]))
+        df = df[df["user"].isin([user for user, _ in top_users])]
+    filters = {
+        "hub": hub,
+        "component": component,
+        "user": user,
+        "usergroup": usergroup,
+    }
+    for column, value in filters.items():
+        if value is not None:
+            df = df[df[column] == value]
+    df = df.sort_values(
+        ["date", "hub", "component", "value"],
+        ascending=[True, True, True, False],
+        kind="stable",
     )
-    return results
+    return df
 
 
 @ttl_lru_cache(seconds_to_live=3600)
@@ -643,18 +703,18 @@ def query_total_costs_per_group(
         List of dicts with keys: date, usergroup and cost.
     """
     try:
-        results = query_total_costs_per_user(date_range=date_range)
+        df = _query_total_costs_per_user_frame(date_range=date_range)
     except Exception as e:
         logger.exception(f"HTTP request failed: {e}")
         raise
-    response = {}
-    for r in results:
-        key = (r["date"], r["usergroup"])
-        logger.debug(f"Key: {key}, Value: {r['value']}")
-        response[key] = response.get(key, 0) + float(r["value"])
-
-    final_response = [
-        {"date": k[0], "usergroup": k[1], "cost": v} for k, v in response.items()
-    ]
+    # Sum costs per date and user group in the order they are first seen in.
+    # np.bincount adds up the costs of each group in row order.
+    keys = ["date", "usergroup"]
+    codes = df.groupby(keys, sort=False).ngroup().to_numpy()
+    values = df["value"].to_numpy(dtype=np.float64)
+    costs = df[keys].drop_duplicates().assign(cost=np.bincount(codes, weights=values))
+    logger.debug(f"Costs per date and user group: {costs}")
+
+    final_response = costs.to_dict(orient="records")
 
     return final_response
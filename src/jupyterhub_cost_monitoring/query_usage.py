@@ -2,16 +2,25 @@
 Query the Prometheus server to get usage of JupyterHub resources.
 """
 
+import atexit
+import json
 import os
 from collections import defaultdict
-from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from string import Template
 
 import escapism
+import ijson
+import numpy as np
+import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from yarl import URL
 
-from .cache import ttl_lru_cache
-from .const_usage import USAGE_MAP, USER_GROUP_INFO
+from .cache import persistent_cache, ttl_lru_cache
+from .const_usage import MIN_STEP_BY_DATE_RANGE_DAYS, USAGE_MAP, USER_GROUP_INFO
 from .date_utils import DateRange, get_now_date
 from .logs import get_logger
 
@@ -22,43 +31,184 @@ prometheus_port = int(os.environ.get("SUPPORT_PROMETHEUS_SERVER_SERVICE_PORT", 9
 prometheus_username = os.environ.get("PROMETHEUS_USERNAME", "")
 prometheus_password = os.environ.get("PROMETHEUS_PASSWORD", "")
 
+# The API URL and credentials don't change, so they are only set up once
+prometheus_query_range_api = str(
+    URL.build(
+        scheme="http",
+        host=prometheus_host,
+        port=prometheus_port,
+        path="/api/v1/query_range",
+    )
+)
+if prometheus_username != "" and prometheus_password != "":
+    prometheus_auth = requests.auth.HTTPBasicAuth(
+        prometheus_username, prometheus_password
+    )
+else:
+    prometheus_auth = None
+
+# A persistent session lets connections to the Prometheus server be kept alive
+# and reused across queries, instead of opening a new connection per query.
+prometheus_session = requests.Session()
+prometheus_session.mount(
+    "http://",
+    HTTPAdapter(
+        pool_connections=10,
+        pool_maxsize=20,
+        # raise_on_status=False hands the last response to raise_for_status,
+        # so callers still see an HTTPError with the upstream status code
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.2,
+            status_forcelist=[502, 503, 504],
+            raise_on_status=False,
+        ),
+    ),
+)
+atexit.register(prometheus_session.close)
+
+# Prometheus queries for different components are independent of each other,
+# so they are submitted to this pool to run concurrently.
+prometheus_executor = ThreadPoolExecutor(max_workers=len(USAGE_MAP))
 
-def query_prometheus(query: str, date_range: DateRange, step: str) -> requests.Response:
+
+@ttl_lru_cache(seconds_to_live=3600)
+def query_prometheus(query: str, date_range: DateRange, step: str) -> dict:
     """
     Query the Prometheus server with the given query over a date range.
 
+    Responses are cached, so that the same query made for different endpoints
+    or repeated dashboard refreshes is only sent to Prometheus once.
+
+    Prometheus is queried one calendar month at a time, and the results are
+    combined for the given date range. Querying whole months lets queries for
+    overlapping date ranges reuse the cached responses for the months they
+    have in common, and usage for months that have ended doesn't change, so
+    their responses are kept for longer. The step should be chosen for the
+    whole date range, as it is the same for all months.
+
     Args:
         query: The Prometheus query string
         date_range: DateRange object containing the time period for the query
         step: The query resolution step duration
 
     Returns:
-        JSON response from Prometheus API
+        Parsed JSON response from Prometheus API, with the values of each time
+        series as an array of [timestamp, value] rows, so that cache hits
+        don't need to parse the response again
     """
-    # Use Prometheus-formatted dates (inclusive date range with ISO timestamps)
-    from_date, to_date = date_range.prometheus_range
+    now_date = get_now_date()
+    from_timestamp = date_range.normalized_start_date.timestamp()
+    to_timestamp = date_range.normalized_end_date.timestamp()
+
+    series = []
+    for month_range in date_range.split_by_month():
+        # Use Prometheus-formatted dates (inclusive date range with ISO timestamps)
+        from_date, to_date = month_range.prometheus_range
+        if month_range.normalized_end_date < now_date:
+            response = _query_prometheus_past_range(query, from_date, to_date, step)
+        else:
+            response = _query_prometheus_range(query, from_date, to_date, step)
+        # Only keep the values for the dates in the date range
+        for data in response["data"]["result"]:
+            values = np.asarray(data["values"], dtype=np.float64).reshape(-1, 2)
+            in_range = (values[:, 0] >= from_timestamp) & (values[:, 0] <= to_timestamp)
+            if in_range.any():
+                series.append({"metric": data["metric"], "values": values[in_range]})
 
-    prometheus_api = URL.build(
-        scheme="http", host=prometheus_host, port=prometheus_port
-    )
-    if prometheus_username != "" and prometheus_password != "":
-        prometheus_auth = requests.auth.HTTPBasicAuth(
-            prometheus_username, prometheus_password
-        )
-    else:
-        prometheus_auth = None
+    return {"data": {"result": series}}
+
+
+@persistent_cache(expire=3600)
+def _query_prometheus_range(query: str, from_date: str, to_date: str, step: str):
+    """
+    Make a range query to the Prometheus server.
+
+    Responses are also cached on disk if a cache directory is configured, to
+    share them between the app's worker processes and keep them across restarts.
+    They are kept for as long as the in-memory cache in query_prometheus keeps
+    them, as usage for the current date is still coming in.
+    """
     parameters = {
         "query": query,
         "start": from_date,
         "end": to_date,
         "step": step,
     }
-    query_api = URL(prometheus_api.with_path("/api/v1/query_range"))
-    with requests.get(query_api, params=parameters, auth=prometheus_auth) as response:
+    with prometheus_session.get(
+        prometheus_query_range_api,
+        params=parameters,
+        auth=prometheus_auth,
+        timeout=(3.05, 30),
+        stream=True,
+    ) as response:
         logger.info(f"Querying Prometheus: {response.url}")
+        if not response.ok:
+            # Read error responses before raising, as the streamed response is
+            # closed when leaving this block, and the error details from
+            # Prometheus are passed on from the HTTPError's response
+            response.content
         response.raise_for_status()
-        result = response.json()
-        return result
+        # Responses for long date ranges can be several MB, mostly made up of
+        # [timestamp, "value"] pairs. They are parsed one time series at a time
+        # as the response is read, and the values of each are kept as an array
+        # of floats, rather than holding the whole response and its parsed
+        # lists of pairs in memory at once.
+        response.raw.decode_content = True
+        series = [
+            {
+                "metric": data["metric"],
+                "values": np.array(data["values"], dtype=np.float64).reshape(-1, 2),
+            }
+            for data in ijson.items(response.raw, "data.result.item", use_float=True)
+        ]
+        return {"data": {"result": series}}
+
+
+@persistent_cache(expire=30 * 24 * 3600)
+def _query_prometheus_past_range(query: str, from_date: str, to_date: str, step: str):
+    """
+    Make a range query to the Prometheus server for a date range that has ended.
+
+    Usage for past dates doesn't change anymore, so responses are kept on disk
+    for 30 days rather than an hour.
+    """
+    return _query_prometheus_range.__wrapped__(query, from_date, to_date, step)
+
+
+def _step_seconds(step: str) -> int:
+    """
+    Convert a Prometheus duration with a single unit, like "5m", to seconds.
+    """
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    return int(step[:-1]) * units[step[-1]]
+
+
+def _get_step(step: str, date_range: DateRange) -> str:
+    """
+    Get the time step to query a date range with, which is the given step
+    unless a coarser step is configured for date ranges of that length.
+    """
+    days = (date_range.normalized_end_date - date_range.normalized_start_date).days + 1
+    for min_days, min_step in MIN_STEP_BY_DATE_RANGE_DAYS.items():
+        if days > min_days and _step_seconds(min_step) > _step_seconds(step):
+            step = min_step
+    return step
+
+
+def _get_usage_query(component: str, hub_name: str | None) -> str:
+    """
+    Get the usage query for a component, only matching the namespace of the
+    given hub, so that Prometheus only returns time series for that hub.
+    """
+    if hub_name is None:
+        namespace_matcher = 'namespace!=""'
+    else:
+        # JSON string escaping is compatible with PromQL string literals
+        namespace_matcher = f"namespace={json.dumps(hub_name)}"
+    # safe_substitute leaves label_replace's "$1" replacement as is
+    query = Template(USAGE_MAP[component]["query"])
+    return query.safe_substitute(namespace_matcher=namespace_matcher)
 
 
 def query_usage(
@@ -67,6 +217,22 @@ def query_usage(
     component_name: str | None,
     user_name: str | None,
 ) -> list[dict]:
+    """
+    Query usage cost factors per user from the Prometheus server, as a list of
+    dicts with date, user, hub, component and value keys.
+
+    See query_usage_frame for details.
+    """
+    df = query_usage_frame(date_range, hub_name, component_name, user_name)
+    return df.to_dict(orient="records")
+
+
+def query_usage_frame(
+    date_range: DateRange,
+    hub_name: str | None,
+    component_name: str | None,
+    user_name: str | None,
+) -> pd.DataFrame:
     """
     Query usage cost factors per user from the Prometheus server.
 
@@ -80,137 +246,159 @@ def query_usage(
         component_name: Optional name of the component to filter results.
         user_name: Optional name of the user to filter results.
     """
-    result = []
     if component_name is None:
         # Query all components defined in USAGE_MAP
-        for component, params in USAGE_MAP.items():
-            try:
-                response = query_prometheus(
-                    params["query"], date_range, step=params["step"]
-                )
-            except requests.exceptions.RequestException:
-                raise
-            result.extend(_process_response(response, component))
+        components = list(USAGE_MAP)
     else:
         # Query specific component only
-        try:
-            response = query_prometheus(
-                USAGE_MAP[component_name]["query"],
-                date_range,
-                step=USAGE_MAP[component_name]["step"],
-            )
-        except requests.exceptions.RequestException:
-            raise
-        result.extend(_process_response(response, component_name))
-    # Calculate daily cost factors from absolute usage totals)
-    result = _calculate_daily_cost_factors(result, hub_name=hub_name)
+        components = [component_name]
+    futures = [
+        prometheus_executor.submit(
+            query_prometheus,
+            _get_usage_query(component, hub_name),
+            date_range,
+            step=_get_step(USAGE_MAP[component]["step"], date_range),
+        )
+        for component in components
+    ]
+    df = _process_responses([future.result() for future in futures], components)
+    # Dates, hubs, users and components repeat across rows, so they are encoded
+    # as categoricals to group, sort and filter by integer codes rather than by
+    # hashing and comparing strings. Categories are sorted, so sorting by codes
+    # sorts by name.
+    df = df.astype(
+        {
+            "date": "category",
+            "hub": "category",
+            "user": "category",
+            "component": "category",
+        }
+    )
+    # Calculate daily cost factors from absolute usage totals
+    df = _add_daily_cost_factors(df, hub_name=hub_name, user_name=user_name)
     # sort the result by date
-    result.sort(key=lambda x: (x["date"], x["component"], x["hub"], x["user"]))
-    result = _filter_json(result, hub=hub_name, user=user_name)
-    return result
+    df = df.sort_values(["date", "component", "hub", "user"], ignore_index=True)
+    return df
 
 
 def _process_response(
-    response: requests.Response,
+    response: dict,
     component_name: str,
-) -> dict:
+) -> pd.DataFrame:
     """
     Process the response from the Prometheus server to extract absolute usage data.
 
-    Converts the time series data into a list of usage records, then pivots by date
-    and sums the absolute usage values across time steps within each date.
+    The Prometheus queries can return multiple absolute usage values per day, so
+    the usage values are summed across the time steps within each date to get the
+    total daily usage for each user.
 
     If the component_name is home storage, then rename the escaped username used for the directory to the unescaped version.
-    """
-    result = []
-    for data in response["data"]["result"]:
-        hub = data["metric"]["namespace"]
-        user = data["metric"]["username"]
-        date = [
-            datetime.fromtimestamp(value[0], tz=timezone.utc).strftime("%Y-%m-%d")
-            for value in data["values"]
-        ]
-        usage = [float(value[1]) for value in data["values"]]
-        result.append(
-            {
-                "hub": hub,
-                "component": component_name,
-                "user": user,
-                "date": date,
-                "value": usage,
-            }
-        )
-    pivoted_result = _pivot_response_dict(result)
-    processed_result = _sum_absolute_usage_by_date(pivoted_result)
-
-    if component_name == "home storage":
-        for entry in processed_result:
-            if "shared" not in entry["user"]:
-                try:
-                    entry["user"] = escapism.unescape(entry["user"], escape_char="-")
-                except ValueError:
-                    logger.warning(
-                        f"Could not unescape username {entry['user']} for home storage component."
-                    )
-                    continue
-    return processed_result
-
-
-def _filter_json(result: list[dict], **filters):
-    return [
-        item
-        for item in result
-        if all(filters[k] is None or item.get(k) == filters[k] for k in filters)
-    ]
 
-
-def _pivot_response_dict(result: list[dict]) -> list[dict]:
-    """
-    Pivot the response dictionary to have top-level keys as dates.
+    Returns:
+        DataFrame with date, user, hub, component and value columns
     """
-    pivot = []
-    for entry in result:
-        for date, value in zip(entry["date"], entry["value"]):
-            pivot.append(
-                {
-                    "date": date,
-                    "user": entry["user"],
-                    "hub": entry["hub"],
-                    "component": entry["component"],
-                    "value": value,
-                }
-            )
-    return pivot
+    return _process_responses([response], [component_name])
 
 
-def _sum_absolute_usage_by_date(result: list[dict]) -> list[dict]:
+def _process_responses(
+    responses: list[dict],
+    component_names: list[str],
+) -> pd.DataFrame:
     """
-    Sum the absolute usage values by date.
+    Process the responses from the Prometheus server for several components,
+    as described for _process_response.
+
+    The responses are combined before summing, so that usage for all
+    components is summed in one pass.
 
-    The Prometheus queries can return multiple absolute usage values per day.
-    We sum across all entries within each date to get the total daily usage for each user.
+    Returns:
+        DataFrame with date, user, hub, component and value columns
     """
-    sums = defaultdict(float)
-
-    for entry in result:
-        key = (
-            entry["date"],
-            entry["user"],
-            entry["hub"],
-            entry["component"],
+    series = [
+        (data, component_name)
+        for response, component_name in zip(responses, component_names)
+        for data in response["data"]["result"]
+    ]
+    counts = [len(data["values"]) for data, _ in series]
+    # Values are [timestamp, value] pairs, combined for all time series into
+    # columns of UTC days since the epoch and usage. numpy parses value strings
+    # as floats if they haven't been converted already.
+    values = np.concatenate(
+        [np.empty((0, 2))]
+        + [
+            np.asarray(data["values"], dtype=np.float64).reshape(-1, 2)
+            for data, _ in series
+        ]
+    )
+    days = (values[:, 0] // 86400).astype(np.int64)
+    # Missing samples are skipped when summing
+    usage = np.nan_to_num(values[:, 1], nan=0.0)
+
+    # Give each (user, hub, component) of the time series an integer code, and
+    # combine it with the day of each sample into one integer key per user and
+    # day. The usage for each key is then summed with np.bincount, in the order
+    # the keys are first seen in.
+    series_index = {}
+    series_codes = [
+        series_index.setdefault(
+            (data["metric"]["username"], data["metric"]["namespace"], component_name),
+            len(series_index),
         )
-        sums[key] += entry["value"]
-
-    return [
+        for data, component_name in series
+    ]
+    first_day = days.min() if len(days) else 0
+    num_days = days.max() - first_day + 1 if len(days) else 1
+    keys = np.repeat(np.array(series_codes, dtype=np.int64), counts) * num_days + (
+        days - first_day
+    )
+    codes, unique_keys = pd.factorize(keys)
+    sums = np.bincount(codes, weights=usage, minlength=len(unique_keys))
+    unique_series, unique_days = np.divmod(unique_keys, num_days)
+
+    users = np.array([user for user, _, _ in series_index], dtype=object)
+    hubs = np.array([hub for _, hub, _ in series_index], dtype=object)
+    components = np.array([component for _, _, component in series_index], dtype=object)
+    df = pd.DataFrame(
         {
-            "date": date,
-            "user": user,
-            "hub": hub,
-            "component": component,
-            "value": total,
+            # Formatting dates is slow compared to summing, so it is only done
+            # once per day, and rows refer to days by their categorical code
+            "date": pd.Categorical.from_codes(
+                unique_days,
+                categories=np.arange(first_day, first_day + num_days)
+                .astype("datetime64[D]")
+                .astype(str),
+            ),
+            "user": users[unique_series],
+            "hub": hubs[unique_series],
+            "component": components[unique_series],
+            "value": sums,
         }
-        for (date, user, hub, component), total in sums.items()
-    ]
+    )
+
+    home_storage = df["component"] == "home storage"
+    if home_storage.any():
+        df.loc[home_storage, "user"] = df.loc[home_storage, "user"].map(
+            {
+                user: _unescape_username(user)
+                for user in df.loc[home_storage, "user"].unique()
+            }
+        )
+    return df
+
+
+def _unescape_username(user: str) -> str:
+    """
+    Unescape a username used for a home directory, unless it is a shared directory.
+    """
+    if "shared" in user:
+        return user
+    try:
+        return escapism.unescape(user, escape_char="-")
+    except ValueError:
+        logger.warning(
+            f"Could not unescape username {user} for home storage component."
+        )
+        return user
 
 
 def _calculate_daily_cost_factors(
@@ -227,32 +415,43 @@ def _calculate_daily_cost_factors(
 
     This ensures that cost factors sum to 1 for the appropriate grouping.
     """
-    # Calculate total usage for the appropriate grouping
-    totals = defaultdict(float)
-    for entry in result:
-        if hub_name is None:
-            # When no specific hub requested, calculate totals across all hubs
-            key = (entry["date"], entry["component"])
-        else:
-            # When specific hub requested, calculate totals per hub
-            key = (entry["date"], entry["hub"], entry["component"])
-        totals[key] += entry["value"]
-
-    # Convert absolute values to cost factors
-    for entry in result:
-        if hub_name is None:
-            # When no specific hub requested, use cross-hub totals
-            key = (entry["date"], entry["component"])
-        else:
-            # When specific hub requested, use per-hub totals
-            key = (entry["date"], entry["hub"], entry["component"])
+    if not result:
+        return []
+    df = _add_daily_cost_factors(pd.DataFrame(result), hub_name=hub_name)
+    return df.to_dict(orient="records")
 
-        total = totals[key]
-        if total > 0:
-            entry["value"] = entry["value"] / total
-        else:
-            entry["value"] = 0.0
-    return result
+
+def _add_daily_cost_factors(
+    df: pd.DataFrame, hub_name: str | None = None, user_name: str | None = None
+) -> pd.DataFrame:
+    """
+    Replace the absolute usage values in a DataFrame with daily cost factors,
+    as described for _calculate_daily_cost_factors.
+
+    If user_name is specified, only the rows of that user are returned. Users
+    are only filtered here rather than in the queries, as cost factors are
+    relative to the usage of all users.
+    """
+    if hub_name is None:
+        # When no specific hub requested, calculate totals across all hubs
+        keys = ["date", "component"]
+    else:
+        # When specific hub requested, calculate totals per hub
+        keys = ["date", "hub", "component"]
+    totals = (
+        df.groupby(keys, sort=False, observed=True)["value"]
+        .transform("sum")
+        .to_numpy(dtype=np.float64)
+    )
+    if user_name is not None:
+        # Totals are needed from all rows, but the rest of the work only for
+        # the rows being returned
+        keep = (df["user"] == user_name).to_numpy()
+        df, totals = df[keep], totals[keep]
+    usage = df["value"].to_numpy(dtype=np.float64)
+    return df.assign(
+        value=np.divide(usage, totals, out=np.zeros_like(usage), where=totals > 0)
+    )
 
 
 @ttl_lru_cache(seconds_to_live=3600)
@@ -266,8 +465,13 @@ def query_user_groups(
     """
     now_date = get_now_date() - timedelta(days=1)
     date_range = DateRange(start_date=now_date, end_date=now_date)
+    # Only one date is queried, so the query isn't split by month as usage
+    # queries for longer date ranges are in query_prometheus
+    from_date, to_date = date_range.prometheus_range
     try:
-        response = query_prometheus(USER_GROUP_INFO, date_range, step="1d")
+        response = _query_prometheus_range(
+            USER_GROUP_INFO, from_date, to_date, step="1d"
+        )
     except requests.exceptions.RequestException as e:
         logger.exception(f"HTTP request failed: {e}")
         raise
@@ -276,7 +480,7 @@ def query_user_groups(
 
 
 def _process_user_groups(
-    response: requests.Response,
+    response: dict,
     hub_name: str | None = None,
     user_name: str | None = None,
     group_name: str | None = None,
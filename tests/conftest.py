@@ -1,11 +1,12 @@
+import copy
 import json
 import os
 from datetime import datetime, timezone
 from unittest.mock import patch
 
 import boto3
+import pandas as pd
 import pytest
-from botocore.stub import Stubber
 
 os.environ["CLUSTER_NAME"] = "test-cluster"
 
@@ -121,7 +122,7 @@ def mock_prometheus_usage_share(request):
     """
     Mock Prometheus response for calculating usage shares.
     """
-    patch_target = "src.jupyterhub_cost_monitoring.query_cost_aws.query_usage"
+    patch_target = "src.jupyterhub_cost_monitoring.query_cost_aws.query_usage_frame"
     filename = "tests/data/test_data_usage.json"
     try:
         with open(f"{filename}") as f:
@@ -132,7 +133,7 @@ def mock_prometheus_usage_share(request):
     usage_shares = _calculate_daily_cost_factors(data)
 
     with patch(patch_target) as mock_func:
-        mock_func.return_value = usage_shares
+        mock_func.return_value = pd.DataFrame(usage_shares)
         yield mock_func
 
 
@@ -171,17 +172,34 @@ def mock_ce():
         "Filter": base_filter/home_storage_filter/core_filter,
     }
     ```
+
+    Cost Explorer queries can be made concurrently, so responses are matched to
+    the filter of each request rather than to the order of requests.
     """
-    aws_ce_client = boto3.client("ce")
-    stubber = Stubber(aws_ce_client)
+    from src.jupyterhub_cost_monitoring.const_cost_aws import (
+        FILTER_CORE_COSTS,
+        FILTER_HOME_STORAGE_COSTS,
+    )
+
+    responses = {}
     for c in ["all", "home_storage", "core"]:
         with open(f"tests/data/test_data_cost_component_{c}.json") as f:
-            response = json.load(f)
-        stubber.add_response("get_cost_and_usage", response)
+            responses[c] = json.load(f)
+
+    def side_effect_func(**kwargs):
+        filters = kwargs.get("Filter", {}).get("And", [])
+        if FILTER_HOME_STORAGE_COSTS in filters:
+            return copy.deepcopy(responses["home_storage"])
+        if FILTER_CORE_COSTS in filters:
+            return copy.deepcopy(responses["core"])
+        return copy.deepcopy(responses["all"])
+
+    aws_ce_client = boto3.client("ce")
     with (
-        stubber,
+        patch.object(aws_ce_client, "get_cost_and_usage", side_effect=side_effect_func),
         patch(
-            "src.jupyterhub_cost_monitoring.query_cost_aws.aws_ce_client", aws_ce_client
+            "src.jupyterhub_cost_monitoring.query_cost_aws._get_ce_client",
+            return_value=aws_ce_client,
         ),
     ):
         yield aws_ce_client
@@ -0,0 +1,72 @@
+import io
+import json
+from unittest.mock import patch
+
+import pytest
+import requests
+from fastapi.testclient import TestClient
+
+from src.jupyterhub_cost_monitoring.app import app
+
+client = TestClient(app)
+
+
+@pytest.mark.parametrize(
+    "to_date, expected_cache_control",
+    [
+        ("2025-09-02", "public, max-age=300, stale-while-revalidate=3600"),
+        (None, "public, max-age=300"),
+    ],
+)
+def test_total_costs_per_component_cache_headers(
+    mock_ce, to_date, expected_cache_control
+):
+    """
+    Test that cached costs for past date ranges can be served stale while revalidating, unlike costs including the current date.
+    """
+    params = {"from": "2025-09-01"}
+    if to_date:
+        params["to"] = to_date
+    response = client.get("/total-costs-per-component", params=params)
+
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == expected_cache_control
+    assert len(response.json()) > 0
+
+
+def test_total_costs_per_component_not_modified(mock_ce):
+    """
+    Test that a 304 response is returned when the ETag of a cached response still matches.
+    """
+    params = {"from": "2025-09-01", "to": "2025-09-02"}
+    response = client.get("/total-costs-per-component", params=params)
+    etag = response.headers["ETag"]
+
+    response = client.get(
+        "/total-costs-per-component", params=params, headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.content == b""
+
+
+def test_prometheus_error_detail():
+    """
+    Test that the error response from Prometheus is passed on in the detail of the error response.
+    """
+    error = {
+        "status": "error",
+        "errorType": "bad_data",
+        "error": "invalid parameter 'query': parse error",
+    }
+    prometheus_response = requests.Response()
+    prometheus_response.status_code = 400
+    prometheus_response.raw = io.BytesIO(json.dumps(error).encode())
+    with patch(
+        "src.jupyterhub_cost_monitoring.query_usage.prometheus_session.get",
+        return_value=prometheus_response,
+    ):
+        response = client.get("/user-groups", params={"hub": "test-error-detail"})
+
+    assert response.status_code == 400
+    assert json.loads(response.json()["detail"]) == error
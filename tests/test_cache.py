@@ -0,0 +1,63 @@
+import pytest
+
+from src.jupyterhub_cost_monitoring import cache
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    """
+    Configure the on-disk cache to use a temporary directory.
+    """
+    monkeypatch.setattr(cache, "CACHE_DIR", str(tmp_path))
+    cache.get_persistent_cache.cache_clear()
+    yield tmp_path
+    cache.get_persistent_cache().close()
+    cache.get_persistent_cache.cache_clear()
+
+
+def test_persistent_cache_disabled_without_cache_dir(monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_DIR", "")
+    cache.get_persistent_cache.cache_clear()
+    calls = []
+
+    @cache.persistent_cache(expire=60)
+    def func(x):
+        calls.append(x)
+        return x
+
+    assert func(1) == 1
+    assert func(1) == 1
+    assert calls == [1, 1]
+
+
+def test_persistent_cache_reuses_results(cache_dir):
+    calls = []
+
+    @cache.persistent_cache(expire=60)
+    def func(filter, group_by):
+        calls.append(filter)
+        return {"filter": filter, "group_by": group_by}
+
+    # unhashable arguments are supported, unlike with ttl_lru_cache
+    assert func({"And": [1, 2]}, group_by=[]) == func({"And": [1, 2]}, group_by=[])
+    assert func({"And": [1, 3]}, group_by=[]) == {
+        "filter": {"And": [1, 3]},
+        "group_by": [],
+    }
+    assert calls == [{"And": [1, 2]}, {"And": [1, 3]}]
+
+
+def test_persistent_cache_expiry_from_result(cache_dir):
+    expiries = []
+
+    def expire(result):
+        expiries.append(result)
+        return 60
+
+    @cache.persistent_cache(expire=expire)
+    def func(x):
+        return x * 2
+
+    assert func(2) == 4
+    assert func(2) == 4
+    assert expiries == [4]
@@ -1,5 +1,15 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
 import pandas as pd
 
+from src.jupyterhub_cost_monitoring import query_cost_aws
+from src.jupyterhub_cost_monitoring.const_cost_aws import (
+    FILTER_CORE_COSTS,
+    FILTER_HOME_STORAGE_COSTS,
+)
+from src.jupyterhub_cost_monitoring.date_utils import parse_from_to_in_query_params
 from src.jupyterhub_cost_monitoring.logs import get_logger
 from src.jupyterhub_cost_monitoring.query_usage import _calculate_daily_cost_factors
 
@@ -61,3 +71,88 @@ def test_cost_factor_by_component(input_data_usage, output_data_component):
     assert df_result["value"].all() == 1.0, (
         "Cost factors do not sum to 1 for each date/component grouping"
     )
+
+
+def test_get_ce_client_from_threads():
+    """
+    Test that the Cost Explorer client is only created once when first requested from several threads at once.
+    """
+
+    def create_client(*args, **kwargs):
+        # widen the window for threads to create clients concurrently
+        time.sleep(0.05)
+        return object()
+
+    query_cost_aws._create_ce_client.cache_clear()
+    try:
+        with patch.object(query_cost_aws.boto3.session, "Session") as session:
+            session.return_value.client.side_effect = create_client
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                clients = list(
+                    executor.map(lambda _: query_cost_aws._get_ce_client(), range(8))
+                )
+        assert session.return_value.client.call_count == 1
+        assert all(client is clients[0] for client in clients)
+    finally:
+        query_cost_aws._create_ce_client.cache_clear()
+
+
+def test_total_costs_per_component_rounding_and_order():
+    """
+    Test that component costs are rounded to cents like Python's round at ties, and listed per date in the order they are reported in.
+    """
+
+    def results_by_time(costs_by_date):
+        return {
+            "ResultsByTime": [
+                {
+                    "TimePeriod": {"Start": date},
+                    "Groups": [
+                        {
+                            "Keys": [service],
+                            "Metrics": {"UnblendedCost": {"Amount": amount}},
+                        }
+                        for service, amount in costs
+                    ],
+                }
+                for date, costs in costs_by_date.items()
+            ]
+        }
+
+    responses = {
+        "all": results_by_time(
+            {
+                "2025-08-01": [
+                    ("Amazon Simple Storage Service", "2.675"),
+                    ("Amazon Elastic Compute Cloud - Compute", "5.0"),
+                ],
+                "2025-08-02": [
+                    ("AWS Backup", "1.0"),
+                    ("Amazon Elastic Compute Cloud - Compute", "3.0"),
+                ],
+            }
+        ),
+        "home storage": results_by_time({"2025-08-01": [("EC2 - Other", "0.5")]}),
+        "core": results_by_time({}),
+    }
+
+    def query_by_month(filter, **kwargs):
+        if FILTER_HOME_STORAGE_COSTS in filter["And"]:
+            return responses["home storage"]
+        if FILTER_CORE_COSTS in filter["And"]:
+            return responses["core"]
+        return responses["all"]
+
+    date_range = parse_from_to_in_query_params("2025-08-01", "2025-08-02")
+    with patch.object(
+        query_cost_aws, "query_aws_cost_explorer_by_month", side_effect=query_by_month
+    ):
+        result = query_cost_aws.query_total_costs_per_component(date_range)
+    assert result == [
+        # np.round would round 2.675 to 2.68
+        {"date": "2025-08-01", "cost": "2.67", "component": "object storage"},
+        {"date": "2025-08-01", "cost": "4.50", "component": "compute"},
+        {"date": "2025-08-01", "cost": "0.50", "component": "home storage"},
+        {"date": "2025-08-02", "cost": "1.00", "component": "backup"},
+        {"date": "2025-08-02", "cost": "3.00", "component": "compute"},
+    ]
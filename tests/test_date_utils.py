@@ -187,6 +187,36 @@ class TestDateRange:
         assert prom_from == "2025-01-01T00:00:00+00:00"
         assert prom_to == "2025-01-31T23:59:59.999999+00:00"
 
+    def test_split_by_month(self):
+        """Test that a date range is split into the full months it overlaps."""
+        start = datetime(2025, 1, 15, 12, 30, 45, tzinfo=timezone.utc)
+        end = datetime(2025, 3, 2, 8, 15, 30, tzinfo=timezone.utc)
+        dr = DateRange(start_date=start, end_date=end)
+
+        month_ranges = [m.aws_range for m in dr.split_by_month()]
+
+        assert month_ranges == [
+            ("2025-01-01", "2025-02-01"),
+            ("2025-02-01", "2025-03-01"),
+            ("2025-03-01", "2025-04-01"),
+        ]
+
+    def test_split_by_month_ends_at_current_date(self):
+        """Test that the month including the current date ends at the current date."""
+        with patch("src.jupyterhub_cost_monitoring.date_utils.datetime") as mock_dt:
+            mock_dt.now.return_value = datetime(2025, 2, 15, tzinfo=timezone.utc)
+
+            dr = DateRange(
+                start_date=datetime(2025, 1, 20, tzinfo=timezone.utc),
+                end_date=datetime(2025, 2, 10, tzinfo=timezone.utc),
+            )
+            month_ranges = [m.aws_range for m in dr.split_by_month()]
+
+        assert month_ranges == [
+            ("2025-01-01", "2025-02-01"),
+            ("2025-02-01", "2025-02-16"),
+        ]
+
 
 class TestParseDateRangeParams:
     """Test parse_from_to_in_query_params function."""
@@ -1,3 +1,4 @@
+import copy
 from collections import defaultdict
 
 import pytest
@@ -92,6 +93,60 @@ def test_total_costs_per_component(mock_ce):
     assert result["core"] == 11.13
 
 
+@pytest.mark.parametrize(
+    "component, expected_cost",
+    [("compute", 8.85), ("home storage", 7.22), ("core", 11.13)],
+)
+def test_total_costs_per_component_filtered(mock_ce, component, expected_cost):
+    """
+    Test that filtering the total costs per component endpoint to one component only returns that component with the same costs.
+    """
+    costs_per_component = query_total_costs_per_component(
+        date_range, component=component
+    )
+    logger.info(f"Costs for {component}: {costs_per_component}")
+
+    assert {item["component"] for item in costs_per_component} == {component}
+    result = {
+        item["date"]: float(item["cost"])
+        for item in costs_per_component
+        if item["date"] == date_range.aws_range[0]
+    }
+    assert result[date_range.aws_range[0]] == expected_cost
+
+
+def test_total_costs_per_component_hub_filter(mock_ce):
+    """
+    Test that the hub filter is added to each Cost Explorer query without modifying the filters shared between queries.
+    """
+    from src.jupyterhub_cost_monitoring import query_cost_aws
+
+    shared_filters = copy.deepcopy(
+        [
+            query_cost_aws._FILTER_ATTRIBUTABLE,
+            query_cost_aws._FILTER_ATTRIBUTABLE_HOME_STORAGE,
+            query_cost_aws._FILTER_ATTRIBUTABLE_CORE,
+        ]
+    )
+    query_total_costs_per_component(date_range, hub_name="staging")
+
+    hub_filter = {
+        "Tags": {
+            "Key": "2i2c:hub-name",
+            "Values": ["staging"],
+            "MatchOptions": ["EQUALS"],
+        },
+    }
+    calls = mock_ce.get_cost_and_usage.call_args_list
+    assert len(calls) == 3
+    assert all(hub_filter in c.kwargs["Filter"]["And"] for c in calls)
+    assert shared_filters == [
+        query_cost_aws._FILTER_ATTRIBUTABLE,
+        query_cost_aws._FILTER_ATTRIBUTABLE_HOME_STORAGE,
+        query_cost_aws._FILTER_ATTRIBUTABLE_CORE,
+    ]
+
+
 @pytest.mark.parametrize("mock_prometheus_usage", [None], indirect=True)
 def test_costs_per_user(
     mock_prometheus_usage,
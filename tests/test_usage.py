@@ -0,0 +1,236 @@
+import io
+import json
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from src.jupyterhub_cost_monitoring.date_utils import DateRange
+from src.jupyterhub_cost_monitoring.query_usage import (
+    _get_step,
+    _get_usage_query,
+    _process_response,
+    _process_responses,
+    _query_prometheus_range,
+    query_prometheus,
+    query_user_groups,
+)
+
+
+@pytest.mark.parametrize(
+    "step, days, expected_step",
+    [
+        ("5m", 30, "5m"),
+        ("5m", 62, "5m"),
+        ("5m", 63, "15m"),
+        ("5m", 367, "1h"),
+        ("1d", 367, "1d"),
+    ],
+)
+def test_get_step(step, days, expected_step):
+    """
+    Test that long date ranges are queried with coarser steps, but never finer steps than configured.
+    """
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    date_range = DateRange(start_date=start, end_date=start + timedelta(days=days - 1))
+    assert _get_step(step, date_range) == expected_step
+
+
+def test_process_response():
+    """
+    Test that usage is summed per user and date across the time steps of each date.
+    """
+    start = datetime(2025, 9, 1, tzinfo=timezone.utc).timestamp()
+    timestamps = [start, start + 12 * 3600, start + 24 * 3600]
+    response = {
+        "data": {
+            "result": [
+                {
+                    "metric": {"namespace": "staging", "username": user},
+                    "values": [[t, str(v)] for t, v in zip(timestamps, values)],
+                }
+                for user, values in [("user_0", [1, 2, 4]), ("user_1", [8, 16, 32])]
+            ]
+        }
+    }
+    result = _process_response(response, "compute").to_dict(orient="records")
+    assert sorted((r["date"], r["user"], r["value"]) for r in result) == [
+        ("2025-09-01", "user_0", 3.0),
+        ("2025-09-01", "user_1", 24.0),
+        ("2025-09-02", "user_0", 4.0),
+        ("2025-09-02", "user_1", 32.0),
+    ]
+
+
+def test_process_responses():
+    """
+    Test that usage for several components is summed separately per component.
+    """
+    start = datetime(2025, 9, 1, tzinfo=timezone.utc).timestamp()
+    response = {
+        "data": {
+            "result": [
+                {
+                    "metric": {"namespace": "staging", "username": "user-2d0"},
+                    "values": [[start, "1"], [start + 3600, "2"]],
+                }
+            ]
+        }
+    }
+    result = _process_responses([response, response], ["compute", "home storage"])
+    assert result.to_dict(orient="records") == [
+        {
+            "date": "2025-09-01",
+            "user": "user-2d0",
+            "hub": "staging",
+            "component": "compute",
+            "value": 3.0,
+        },
+        {
+            "date": "2025-09-01",
+            "user": "user-0",
+            "hub": "staging",
+            "component": "home storage",
+            "value": 3.0,
+        },
+    ]
+
+
+def test_query_prometheus_range():
+    """
+    Test that time series values are parsed from the streamed response into arrays.
+    """
+    payload = {
+        "status": "success",
+        "data": {
+            "resultType": "matrix",
+            "result": [
+                {
+                    "metric": {"namespace": "staging", "username": "user_0"},
+                    "values": [[1756684800, "1.5"], [1756688400, "NaN"]],
+                }
+            ],
+        },
+    }
+    response = MagicMock(raw=io.BytesIO(json.dumps(payload).encode()))
+    with patch(
+        "src.jupyterhub_cost_monitoring.query_usage.prometheus_session.get"
+    ) as mock_get:
+        mock_get.return_value.__enter__.return_value = response
+        result = _query_prometheus_range("up", "2025-09-01", "2025-09-01", "1h")
+    assert mock_get.call_args.kwargs["stream"] is True
+    (series,) = result["data"]["result"]
+    assert series["metric"] == {"namespace": "staging", "username": "user_0"}
+    assert series["values"].shape == (2, 2)
+    assert series["values"][0].tolist() == [1756684800, 1.5]
+    records = _process_response(result, "compute").to_dict(orient="records")
+    assert records == [
+        {
+            "date": "2025-09-01",
+            "user": "user_0",
+            "hub": "staging",
+            "component": "compute",
+            "value": 1.5,
+        }
+    ]
+
+
+def test_query_prometheus_by_month():
+    """
+    Test that Prometheus is queried per calendar month, and that past months are cached for longer.
+    """
+    day = 24 * 3600
+    aug_1 = datetime(2025, 8, 1, tzinfo=timezone.utc).timestamp()
+    sep_1 = datetime(2025, 9, 1, tzinfo=timezone.utc).timestamp()
+
+    def query_range(query, from_date, to_date, step):
+        month_start = datetime.fromisoformat(from_date).timestamp()
+        return {
+            "data": {
+                "result": [
+                    {
+                        "metric": {"namespace": "staging", "username": "user_0"},
+                        "values": [[month_start + i * day, "1"] for i in range(31)],
+                    }
+                ]
+            }
+        }
+
+    date_range = DateRange(
+        start_date=datetime(2025, 8, 30, tzinfo=timezone.utc),
+        end_date=datetime(2025, 9, 2, tzinfo=timezone.utc),
+    )
+    module = "src.jupyterhub_cost_monitoring.query_usage"
+    with (
+        patch(
+            f"{module}._query_prometheus_past_range", side_effect=query_range
+        ) as past,
+        patch(f"{module}._query_prometheus_range") as current,
+    ):
+        result = query_prometheus("test_query_prometheus_by_month", date_range, "1d")
+    current.assert_not_called()
+    assert [c.args[1:3] for c in past.call_args_list] == [
+        ("2025-08-01T00:00:00+00:00", "2025-08-31T23:59:59.999999+00:00"),
+        ("2025-09-01T00:00:00+00:00", "2025-09-30T23:59:59.999999+00:00"),
+    ]
+    timestamps = [
+        t for data in result["data"]["result"] for t in data["values"][:, 0].tolist()
+    ]
+    assert timestamps == [aug_1 + 29 * day, aug_1 + 30 * day, sep_1, sep_1 + day]
+
+
+def test_query_user_groups_single_day():
+    """
+    Test that user groups are only queried for the previous day, rather than the month so far.
+    """
+    module = "src.jupyterhub_cost_monitoring.query_usage"
+    response = {
+        "data": {
+            "result": [
+                {
+                    "metric": {
+                        "namespace": "staging",
+                        "username": "user_0",
+                        "username_escaped": "user-5f0",
+                        "usergroup": "group_0",
+                    },
+                    "values": [[1760313600, "1"]],
+                }
+            ]
+        }
+    }
+    with (
+        patch(
+            f"{module}.get_now_date",
+            return_value=datetime(2026, 10, 14, tzinfo=timezone.utc),
+        ),
+        patch(f"{module}._query_prometheus_range", return_value=response) as query,
+    ):
+        # the hub name only avoids cached results from other tests
+        result = query_user_groups(hub_name="test_query_user_groups_single_day")
+    assert query.call_count == 1
+    assert query.call_args.args[1:3] == (
+        "2026-10-13T00:00:00+00:00",
+        "2026-10-13T23:59:59.999999+00:00",
+    )
+    assert query.call_args.kwargs["step"] == "1d"
+    assert result == [
+        {
+            "hub": "staging",
+            "username": "user_0",
+            "username_escaped": "user-5f0",
+            "usergroup": "group_0",
+        }
+    ]
+
+
+@pytest.mark.parametrize("component", ["compute", "home storage"])
+def test_get_usage_query(component):
+    """
+    Test that usage queries only match the namespace of the requested hub.
+    """
+    assert 'namespace!=""' in _get_usage_query(component, None)
+    query = _get_usage_query(component, "staging")
+    assert 'namespace="staging"' in query
+    assert "${namespace_matcher}" not in query
+    assert '"$1"' in query